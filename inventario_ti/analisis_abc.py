@@ -0,0 +1,77 @@
+import threading
+import numpy as np
+import pandas as pd
+
+CRITERIOS_ABC = {"valor": "valor", "movimiento": "volumen"}
+
+class ClasificadorABC:
+    def __init__(self, sistema_inventario):
+        self.sistema = sistema_inventario
+        # criterio -> (version_datos, catálogo ordenado). Los umbrales se aplican en cada llamada:
+        # así hay como máximo una copia del catálogo por criterio, sin importar cuántos umbrales se prueben.
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def clasificar(self, criterio="valor", umbral_a=0.80, umbral_b=0.95):
+        """
+        Clasificación ABC (Pareto) del catálogo. 'valor' = precio_compra * stock,
+        'movimiento' = unidades despachadas. Los umbrales son la participación acumulada
+        donde termina cada clase. Devuelve (detalle por SKU, resumen por clase).
+        """
+        if criterio not in CRITERIOS_ABC: raise ValueError(f"Criterio desconocido: {criterio}")
+        if not 0 < umbral_a <= umbral_b <= 1: raise ValueError("Se requiere 0 < umbral A <= umbral B <= 1")
+
+        version = self.sistema.version_datos('productos', 'stock_ubicacion', 'movimientos')
+        en_cache = self._cache.get(criterio)
+        if en_cache and en_cache[0] == version:
+            ordenado = en_cache[1]
+        else:
+            ordenado = self._ordenar(self.sistema.db.obtener_datos_abc(), CRITERIOS_ABC[criterio])
+            with self._lock:
+                self._cache[criterio] = (version, ordenado)
+        return self._clasificar(ordenado, umbral_a, umbral_b)
+
+    def _ordenar(self, df, columna):
+        if df.empty: return pd.DataFrame()
+
+        # Una sola pasada vectorizada: métrica -> orden -> participación acumulada
+        precio = pd.to_numeric(df['precio_compra'], errors='coerce').fillna(0).to_numpy(dtype='float64')
+        stock = pd.to_numeric(df['stock'], errors='coerce').fillna(0).to_numpy(dtype='float64')
+        volumen = pd.to_numeric(df['volumen'], errors='coerce').fillna(0).to_numpy(dtype='float64')
+        valor = precio * stock
+        metrica = valor if columna == 'valor' else volumen
+
+        orden = np.argsort(-metrica, kind='stable')
+        ordenada = metrica[orden]
+        total = ordenada.sum()
+        participacion = ordenada / total if total > 0 else np.zeros_like(ordenada)
+
+        ordenado = df[['sku', 'nombre', 'categoria']].take(orden).reset_index(drop=True)
+        ordenado.insert(0, 'ranking', np.arange(1, len(orden) + 1))
+        ordenado['valor'] = valor[orden]
+        ordenado['volumen'] = volumen[orden]
+        ordenado['participacion'] = participacion
+        ordenado['acumulado'] = np.cumsum(participacion)
+        return ordenado
+
+    def _clasificar(self, ordenado, umbral_a, umbral_b):
+        if ordenado.empty: return pd.DataFrame(), pd.DataFrame()
+
+        participacion = ordenado['participacion'].to_numpy()
+        # Se clasifica por lo acumulado *antes* del SKU: el primero siempre es A aunque pese más que el umbral
+        previo = ordenado['acumulado'].to_numpy() - participacion
+        con_peso = participacion > 0
+        codigo = np.select([(previo < umbral_a) & con_peso, (previo < umbral_b) & con_peso], [0, 1], 2)
+        detalle = ordenado.assign(clase=np.array(['A', 'B', 'C'])[codigo])
+
+        # Resumen por clase con bincount (evita un groupby sobre strings)
+        skus = np.bincount(codigo, minlength=3)
+        resumen = pd.DataFrame({
+            'clase': ['A', 'B', 'C'],
+            'skus': skus,
+            'pct_skus': skus / len(detalle),
+            'participacion': np.bincount(codigo, weights=participacion, minlength=3),
+            'valor': np.bincount(codigo, weights=detalle['valor'].to_numpy(), minlength=3),
+            'volumen': np.bincount(codigo, weights=detalle['volumen'].to_numpy(), minlength=3),
+        })
+        return detalle, resumen
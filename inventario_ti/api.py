@@ -0,0 +1,94 @@
+# API HTTP sin interfaz para escáneres y ERP. Reutiliza SistemaInventario.
+# Ejecutar:  API_TOKEN=<token> uvicorn api:app --host 0.0.0.0 --port 8000 --workers 4
+# API_TOKEN es obligatorio: sin él la API no arranca. Todas las rutas salvo /salud
+# exigen 'Authorization: Bearer <token>'.
+import os
+import math
+import secrets
+from typing import List, Optional
+from fastapi import Depends, FastAPI, Header, HTTPException, Query
+from pydantic import BaseModel, Field
+from backend import SistemaInventario
+from database import ERROR_BD_OCUPADA, ERROR_CONEXION
+
+API_TOKEN = os.getenv("API_TOKEN")
+if not API_TOKEN:
+    # Las rutas de escritura no pueden quedar abiertas en la red
+    raise RuntimeError("Defina API_TOKEN antes de iniciar la API")
+
+app = FastAPI(title="TechInventory Pro API", version="1.0")
+sistema = SistemaInventario()
+
+class Movimiento(BaseModel):
+    sku: str
+    cantidad: int = Field(gt=0)
+    tipo: str = Field(pattern="(?i)^(entrada|salida)$")
+    motivo: str = ""
+    ubicacion: Optional[str] = None
+
+class LoteMovimientos(BaseModel):
+    movimientos: List[Movimiento] = Field(min_length=1, max_length=1000)
+
+def verificar_token(authorization: Optional[str] = Header(None)):
+    # Comparación en tiempo constante: no revela cuántos caracteres coinciden
+    if not secrets.compare_digest((authorization or "").encode(), f"Bearer {API_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Token inválido")
+
+def _limpiar(registro):
+    # NaN no es JSON válido: se envía como null
+    return {k: None if isinstance(v, float) and math.isnan(v) else v for k, v in registro.items()}
+
+def _registros(df):
+    return [_limpiar(r) for r in df.to_dict('records')] if not df.empty else []
+
+# Fallos transitorios de la BD: el cliente puede reintentar con la misma Idempotency-Key.
+# "Error update" (SQL/esquema) es permanente y queda en 400.
+ERRORES_TRANSITORIOS = (ERROR_CONEXION, ERROR_BD_OCUPADA)
+
+def _respuesta_movimiento(ok, msg):
+    if ok: return {"ok": True, "mensaje": msg}
+    if msg.startswith("No existe"): codigo = 404
+    elif msg.startswith("Stock insuficiente"): codigo = 409
+    elif msg.startswith("Clave de idempotencia reutilizada"): codigo = 422
+    elif msg.startswith(ERRORES_TRANSITORIOS): codigo = 503
+    else: codigo = 400
+    raise HTTPException(status_code=codigo, detail=msg)
+
+# Rutas síncronas: FastAPI las corre en su pool de hilos, sin bloquear el event loop
+
+@app.get("/salud")
+def salud():
+    return {"ok": True}
+
+@app.get("/productos/{sku}", dependencies=[Depends(verificar_token)])
+def obtener_producto(sku: str):
+    producto = sistema.obtener_producto(sku)
+    if not producto: raise HTTPException(status_code=404, detail="No existe producto")
+    return _limpiar(producto)
+
+@app.get("/productos", dependencies=[Depends(verificar_token)])
+def buscar_productos(q: str = "", limit: int = Query(100, ge=1, le=1000)):
+    return _registros(sistema.buscar_funcional(q, limit))
+
+@app.post("/movimientos", dependencies=[Depends(verificar_token)])
+def registrar_movimiento(mov: Movimiento, idempotency_key: Optional[str] = Header(None)):
+    ok, msg = sistema.registrar_movimiento(mov.sku, mov.cantidad, mov.tipo, mov.motivo, mov.ubicacion, idempotency_key)
+    return _respuesta_movimiento(ok, msg)
+
+@app.post("/movimientos/lote", dependencies=[Depends(verificar_token)])
+def registrar_lote(lote: LoteMovimientos, idempotency_key: Optional[str] = Header(None)):
+    ok, msg = sistema.registrar_movimientos_lote([m.model_dump() for m in lote.movimientos], idempotency_key)
+    return _respuesta_movimiento(ok, msg)
+
+@app.get("/ubicaciones", dependencies=[Depends(verificar_token)])
+def ubicaciones():
+    return sistema.obtener_ubicaciones()
+
+@app.get("/kpis", dependencies=[Depends(verificar_token)])
+def kpis():
+    res = sistema.obtener_kpis()
+    return {'total_items': int(res['total_items']), 'total_valor': float(res['total_valor']), 'alertas': int(res['alertas'])}
+
+@app.get("/kpis/ubicaciones", dependencies=[Depends(verificar_token)])
+def kpis_por_ubicacion():
+    return [_limpiar(r) for r in sistema.obtener_kpis_por_ubicacion()]
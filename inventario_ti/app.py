@@ -4,10 +4,7 @@ import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import pandas as pd
 from backend import SistemaInventario
-import hashlib
-import json
-import os
-from typing import Dict
+from autenticacion import SistemaAutenticacion
 
 # ==============================================================================
 # 1. CONFIGURACIÓN DE PÁGINA (ESTO DEBE IR PRIMERO SIEMPRE PARA EVITAR PANTALLA NEGRA)
@@ -94,73 +91,16 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# ========== SISTEMA DE AUTENTICACIÓN (Lógica) ==========
-class SistemaAutenticacion:
-    def __init__(self, archivo_usuarios="usuarios.json"):
-        self.archivo_usuarios = archivo_usuarios
-        self._cargar_usuarios()
-    
-    def _cargar_usuarios(self):
-        if os.path.exists(self.archivo_usuarios):
-            try:
-                with open(self.archivo_usuarios, 'r') as f:
-                    self.usuarios = json.load(f)
-            except:
-                self.usuarios = self._usuarios_por_defecto()
-        else:
-            self.usuarios = self._usuarios_por_defecto()
-            self._guardar_usuarios()
-    
-    def _usuarios_por_defecto(self) -> Dict:
-        return {
-            "admin": {
-                "contrasena_hash": self._hash_password("admin123"),
-                "nombre": "Administrador Principal",
-                "rol": "admin",
-                "fecha_creacion": datetime.now().strftime("%Y-%m-%d"),
-                "avatar": "👑"
-            },
-            "supervisor": {
-                "contrasena_hash": self._hash_password("sup123"),
-                "nombre": "Supervisor de Inventario",
-                "rol": "supervisor",
-                "fecha_creacion": datetime.now().strftime("%Y-%m-%d"),
-                "avatar": "👨‍💼"
-            },
-            "milagros": {
-                "contrasena_hash": self._hash_password("mila123"),
-                "nombre": "Milagros",
-                "rol": "supervisor",
-                "fecha_creacion": datetime.now().strftime("%Y-%m-%d"),
-                "avatar": "👩‍💼"
-            }
-        }
-    
-    def _hash_password(self, password: str) -> str:
-        return hashlib.sha256(password.encode()).hexdigest()
-    
-    def _guardar_usuarios(self):
-        with open(self.archivo_usuarios, 'w') as f:
-            json.dump(self.usuarios, f, indent=4)
-    
-    def autenticar(self, usuario: str, contrasena: str) -> bool:
-        if usuario in self.usuarios:
-            contrasena_hash = self._hash_password(contrasena)
-            if self.usuarios[usuario]["contrasena_hash"] == contrasena_hash:
-                return True
-        return False
-    
-    def obtener_datos_usuario(self, usuario: str) -> Dict:
-        return self.usuarios.get(usuario, {})
-    
-    def actualizar_ultimo_acceso(self, usuario: str):
-        if usuario in self.usuarios:
-            self.usuarios[usuario]["fecha_ultimo_acceso"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            self._guardar_usuarios()
+@st.cache_resource
+def get_sistema():
+    return SistemaInventario()
 
+# ========== SISTEMA DE AUTENTICACIÓN (Lógica en autenticacion.py) ==========
 @st.cache_resource
 def get_auth_system():
-    return SistemaAutenticacion()
+    # Reutiliza la conexión y el feed de cambios del sistema: uno solo por proceso
+    sistema = get_sistema()
+    return SistemaAutenticacion(db=sistema.db, feed=sistema.feed)
 
 auth = get_auth_system()
 
@@ -235,10 +175,6 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-@st.cache_resource
-def get_sistema():
-    return SistemaInventario()
-
 app = get_sistema()
 
 usuario_actual = st.session_state["usuario"]
@@ -368,25 +304,59 @@ elif menu == "nuevo":
                 st.warning("SKU y Nombre son obligatorios")
 
 elif menu == "movimientos":
+    # Solo ubicaciones dadas de alta: evita sedes fantasma por errores de tipeo
+    ubicaciones = app.obtener_ubicaciones()
     st.markdown('<div class="card"><h3>🔄 Registrar Movimiento</h3></div>', unsafe_allow_html=True)
     with st.form("mov"):
         sku = st.text_input("SKU Producto")
         tipo = st.selectbox("Tipo", ["Entrada", "Salida"])
         cant = st.number_input("Cantidad", 1, step=1)
+        ubicacion = st.selectbox("Ubicación", ubicaciones)
         motivo = st.text_input("Motivo")
         
         if st.form_submit_button("Registrar", type="primary"):
-            ok, msg = app.registrar_movimiento(sku, cant, tipo, motivo)
+            ok, msg = app.registrar_movimiento(sku, cant, tipo, motivo, ubicacion)
             if ok: st.success(msg)
             else: st.error(msg)
+    
+    st.markdown('<div class="card"><h3>🚚 Transferir entre Ubicaciones</h3></div>', unsafe_allow_html=True)
+    with st.form("transferencia"):
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            sku_t = st.text_input("SKU")
+            cant_t = st.number_input("Cantidad ", 1, step=1)
+        with c2:
+            origen = st.selectbox("Origen", ubicaciones)
+        with c3:
+            destino = st.selectbox("Destino", ubicaciones, index=min(1, len(ubicaciones) - 1))
+        
+        if st.form_submit_button("Transferir", type="primary"):
+            ok, msg = app.transferir_stock(sku_t, cant_t, origen, destino)
+            if ok: st.success(msg)
+            else: st.error(msg)
+
+    if rol_usuario == "admin":
+        with st.form("nueva_ubicacion"):
+            nueva = st.text_input("Nueva ubicación")
+            if st.form_submit_button("Crear ubicación"):
+                ok, msg = app.agregar_ubicacion(nueva)
+                if ok:
+                    st.success(msg)
+                    st.rerun()
+                else: st.error(msg)
             
     st.divider()
-    st.subheader("Historial Reciente")
-    st.dataframe(pd.DataFrame(app.obtener_historial_movimientos()), use_container_width=True)
+    c1, c2 = st.columns(2)
+    with c1:
+        st.subheader("Historial Reciente")
+        st.dataframe(pd.DataFrame(app.obtener_historial_movimientos()), use_container_width=True)
+    with c2:
+        st.subheader("Stock por Ubicación")
+        st.dataframe(pd.DataFrame(app.obtener_kpis_por_ubicacion()), use_container_width=True)
 
 elif menu == "analisis":
     st.markdown('<div class="card"><h3>🧠 Análisis Avanzado</h3></div>', unsafe_allow_html=True)
-    tab1, tab2 = st.tabs(["NumPy Analytics", "Reportes"])
+    tab1, tab2, tab3 = st.tabs(["NumPy Analytics", "Reportes", "Clasificación ABC"])
     
     with tab1:
         if st.button("Ejecutar Análisis de Precios"):
@@ -398,13 +368,62 @@ elif menu == "analisis":
             out = app.identificar_outliers_numpy()
             if out: st.dataframe(out)
             else: st.info("No se detectaron outliers")
+    
+    with tab3:
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            criterio = st.selectbox("Criterio", ["valor", "movimiento"], format_func=lambda c: "Valor en stock" if c == "valor" else "Unidades despachadas")
+        with c2:
+            pct_a = st.slider("Límite clase A (%)", 50, 95, 80)
+        with c3:
+            pct_b = st.slider("Límite clase B (%)", pct_a, 100, max(95, pct_a))
+        
+        # Porcentajes enteros hasta aquí: evita que el redondeo deje B < A
+        detalle, resumen = app.clasificar_abc(criterio, pct_a / 100, pct_b / 100)
+        if detalle.empty:
+            st.info("No hay productos para clasificar")
+        else:
+            st.dataframe(resumen, use_container_width=True)
+            # Curva de Pareto muestreada: con catálogos enormes no se dibujan todos los puntos
+            paso = max(1, len(detalle) // 2000)
+            curva = detalle.iloc[::paso]
+            fig = px.line(curva, x='ranking', y='acumulado', color='clase', title="Curva de Pareto")
+            st.plotly_chart(fig, use_container_width=True)
+            
+            clase_ver = st.selectbox("Ver SKUs de la clase", ["A", "B", "C"])
+            st.dataframe(detalle[detalle['clase'] == clase_ver].head(1000), use_container_width=True)
 
 elif menu == "historial":
     st.markdown('<div class="card"><h3>📋 Bitácora del Sistema</h3></div>', unsafe_allow_html=True)
-    st.dataframe(pd.DataFrame(app.obtener_historial_completo()), use_container_width=True)
+    tab1, tab2 = st.tabs(["Bitácora", "Stock a una Fecha"])
+    
+    with tab1:
+        st.dataframe(pd.DataFrame(app.obtener_historial_completo()), use_container_width=True)
+    
+    with tab2:
+        c1, c2 = st.columns([2, 1])
+        with c1:
+            fecha_corte = st.date_input("Stock al cierre del día (hora local)", datetime.now().date().replace(day=1) - timedelta(days=1))
+        with c2:
+            st.markdown("###")
+            if st.button("📸 Crear checkpoint ahora", use_container_width=True):
+                ok, msg = app.crear_checkpoint_stock()
+                if ok: st.success(msg)
+                else: st.error(msg)
+        
+        if st.button("Consultar", type="primary"):
+            df_fecha = app.stock_a_fecha(fecha_corte)
+            total = df_fecha['valor'].sum() if 'valor' in df_fecha.columns else 0
+            st.metric("Valor a la fecha", f"S/. {total:,.2f}")
+            st.caption(f"Base: {df_fecha.attrs.get('origen')} | Movimientos reproducidos: {df_fecha.attrs.get('movimientos_reproducidos', 0)}")
+            st.dataframe(df_fecha, use_container_width=True)
+        
+        with st.expander("Checkpoints guardados"):
+            st.dataframe(pd.DataFrame(app.obtener_checkpoints()), use_container_width=True)
 
 elif menu == "usuarios" and rol_usuario == "admin":
     st.markdown('<div class="card"><h3>👥 Gestión de Usuarios</h3></div>', unsafe_allow_html=True)
+    auth.recargar()
     st.dataframe(pd.DataFrame(auth.usuarios.values()), use_container_width=True)
 
 # Footer
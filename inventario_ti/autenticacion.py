@@ -0,0 +1,133 @@
+import atexit
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict
+from database import DatabaseManager
+from cambios import FeedCambios
+
+# Los últimos accesos se acumulan en memoria y se escriben en lote cada tantos segundos
+INTERVALO_FLUSH_ACCESOS = 5.0
+# Ante un usuario desconocido se relee la BD como mucho una vez por este intervalo
+INTERVALO_RECARGA_USUARIOS = 5.0
+
+class SistemaAutenticacion:
+    def __init__(self, archivo_usuarios="usuarios.json", db=None, feed=None):
+        self.archivo_usuarios = archivo_usuarios
+        self.db = db or DatabaseManager()
+        self._lock = threading.Lock()
+        self._accesos_pendientes = {}
+        self._ultima_recarga = 0.0
+        self._cargar_usuarios()
+
+        # Altas hechas por otros workers llegan por el feed de cambios. Si se pasa el feed
+        # de SistemaInventario se comparte su hilo; si no, se crea uno propio.
+        self.feed = feed
+        if self.feed is None:
+            self.feed = FeedCambios(self.db)
+            self.feed.iniciar()
+        self.feed.suscribir(lambda tabla, usuario: self.recargar(), tablas=['usuarios'])
+        self._hilo_flush = threading.Thread(target=self._bucle_flush, name="flush-accesos", daemon=True)
+        self._hilo_flush.start()
+        atexit.register(self.flush_accesos)
+
+    def _cargar_usuarios(self):
+        self.recargar()
+        if not self.usuarios:
+            # Primera ejecución: se migra usuarios.json (o los usuarios por defecto) a la BD.
+            # Después el JSON ya no se lee: altas y reseteos con crear_usuarios.py
+            usuarios = None
+            if os.path.exists(self.archivo_usuarios):
+                try:
+                    with open(self.archivo_usuarios, 'r') as f:
+                        usuarios = json.load(f)
+                except:
+                    usuarios = None
+            self.db.guardar_usuarios(usuarios or self._usuarios_por_defecto())
+            self.recargar()
+
+    def recargar(self):
+        usuarios = {u['usuario']: self._limpiar(u) for u in self.db.obtener_usuarios()}
+        with self._lock:
+            # Accesos aún no escritos en la BD no deben perderse al recargar
+            for usuario, fecha in self._accesos_pendientes.items():
+                if usuario in usuarios: usuarios[usuario]["fecha_ultimo_acceso"] = fecha
+            self.usuarios = usuarios
+            self._ultima_recarga = time.monotonic()
+
+    def _limpiar(self, registro):
+        return {k: v for k, v in registro.items() if k != 'usuario' and not (isinstance(v, float) and math.isnan(v)) and v is not None}
+
+    def _usuarios_por_defecto(self) -> Dict:
+        return {
+            "admin": {
+                "contrasena_hash": self._hash_password("admin123"),
+                "nombre": "Administrador Principal",
+                "rol": "admin",
+                "fecha_creacion": datetime.now().strftime("%Y-%m-%d"),
+                "avatar": "👑"
+            },
+            "supervisor": {
+                "contrasena_hash": self._hash_password("sup123"),
+                "nombre": "Supervisor de Inventario",
+                "rol": "supervisor",
+                "fecha_creacion": datetime.now().strftime("%Y-%m-%d"),
+                "avatar": "👨‍💼"
+            },
+            "milagros": {
+                "contrasena_hash": self._hash_password("mila123"),
+                "nombre": "Milagros",
+                "rol": "supervisor",
+                "fecha_creacion": datetime.now().strftime("%Y-%m-%d"),
+                "avatar": "👩‍💼"
+            }
+        }
+
+    def _hash_password(self, password: str) -> str:
+        return hashlib.sha256(password.encode()).hexdigest()
+
+    def _buscar(self, usuario: str) -> Dict:
+        datos = self.usuarios.get(usuario)
+        if datos is None and time.monotonic() - self._ultima_recarga > INTERVALO_RECARGA_USUARIOS:
+            # Usuario desconocido: puede que se haya creado recién en otro worker
+            self.recargar()
+            datos = self.usuarios.get(usuario)
+        return datos
+
+    def autenticar(self, usuario: str, contrasena: str) -> bool:
+        datos = self._buscar(usuario)
+        if datos:
+            contrasena_hash = self._hash_password(contrasena)
+            if datos["contrasena_hash"] == contrasena_hash:
+                return True
+        return False
+
+    def obtener_datos_usuario(self, usuario: str) -> Dict:
+        return self.usuarios.get(usuario, {})
+
+    def actualizar_ultimo_acceso(self, usuario: str):
+        # Solo memoria: la escritura a la BD la hace flush_accesos en segundo plano
+        if usuario in self.usuarios:
+            fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            with self._lock:
+                self.usuarios[usuario]["fecha_ultimo_acceso"] = fecha
+                self._accesos_pendientes[usuario] = fecha
+
+    def flush_accesos(self):
+        with self._lock:
+            pendientes, self._accesos_pendientes = self._accesos_pendientes, {}
+        if not pendientes: return
+        if not self.db.actualizar_accesos(pendientes):
+            # Reintentar en el próximo ciclo sin pisar accesos más nuevos
+            with self._lock:
+                for usuario, fecha in pendientes.items():
+                    self._accesos_pendientes.setdefault(usuario, fecha)
+
+    def _bucle_flush(self):
+        while True:
+            time.sleep(INTERVALO_FLUSH_ACCESOS)
+            self.flush_accesos()
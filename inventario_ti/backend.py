@@ -1,12 +1,36 @@
+import threading
 import pandas as pd
 from database import DatabaseManager
 from analisis_numpy import AnalisisNumerico
+from analisis_abc import ClasificadorABC
+from cambios import FeedCambios
+from historico_stock import HistoricoStock
 from functools import reduce
 
 class SistemaInventario:
     def __init__(self):
         self.db = DatabaseManager()
         self.analizador_numpy = AnalisisNumerico(self)
+        self.historico = HistoricoStock(self)
+        self.clasificador_abc = ClasificadorABC(self)
+        
+        # Caché local invalidada por el feed de cambios (otros workers incluidos)
+        self.versiones = {}
+        self._cache_productos = {}
+        self._lock_cache = threading.Lock()
+        self.feed = FeedCambios(self.db)
+        self.feed.suscribir(self._invalidar_cache)
+        self.feed.iniciar()
+        
+    def _invalidar_cache(self, tabla, sku=None):
+        with self._lock_cache:
+            self.versiones[tabla] = self.versiones.get(tabla, 0) + 1
+            if sku is None: self._cache_productos.clear()
+            else: self._cache_productos.pop(sku, None)
+    
+    def version_datos(self, *tablas):
+        """Clave de caché: cambia cada vez que cambia alguna de las tablas indicadas"""
+        return tuple(self.versiones.get(t, 0) for t in tablas)
         
     @property
     def df(self):
@@ -22,26 +46,69 @@ class SistemaInventario:
                 if c in df.columns: df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0)
         return df
     
-    def buscar_funcional(self, busqueda=""):
-        datos = self.db.obtener_productos(busqueda)
+    def buscar_funcional(self, busqueda="", limit=None):
+        datos = self.db.obtener_productos(busqueda, limit)
         # BLINDAJE: Siempre devolver DataFrame a la App
         return pd.DataFrame(datos) if datos else pd.DataFrame()
     
+    def obtener_producto(self, sku):
+        # Búsqueda por SKU servida desde caché hasta que el feed avise de un cambio
+        producto = self._cache_productos.get(sku)
+        if producto is None:
+            version = self.version_datos('productos', 'stock_ubicacion')
+            producto = self.db.obtener_producto(sku)
+            with self._lock_cache:
+                # Si llegó un cambio mientras leíamos, no guardar un dato posiblemente viejo
+                if producto and version == self.version_datos('productos', 'stock_ubicacion'):
+                    self._cache_productos[sku] = producto
+        return producto
+    
     # --- Pasarelas directas (Wrappers) ---
-    def registrar_producto(self, *args): return self.db.agregar_producto(*args)
-    def registrar_movimiento(self, sku, cant, tipo, mot=""): 
+    def registrar_producto(self, *args):
+        ok, msg = self.db.agregar_producto(*args)
+        if ok: self._invalidar_cache('productos', args[0])
+        return ok, msg
+    def registrar_movimiento(self, sku, cant, tipo, mot="", ubicacion=None, clave_idempotencia=None): 
         tipo = "entrada" if tipo.lower() == "entrada" else "salida"
-        return self.db.actualizar_stock(sku, cant, tipo, mot)
+        ok, msg = self.db.actualizar_stock(sku, cant, tipo, mot, ubicacion, clave_idempotencia)
+        # Invalidación inmediata en este worker; los demás se enteran por el feed
+        if ok:
+            self._invalidar_cache('productos', sku)
+            self.historico.registrar_movimiento()
+        return ok, msg
+    def registrar_movimientos_lote(self, movimientos, clave_idempotencia=None):
+        movimientos = [{**m, 'tipo': "entrada" if m['tipo'].lower() == "entrada" else "salida"} for m in movimientos]
+        ok, msg = self.db.registrar_movimientos_lote(movimientos, clave_idempotencia)
+        if ok:
+            for m in movimientos: self._invalidar_cache('productos', m['sku'])
+            self.historico.registrar_movimiento()
+        return ok, msg
+    def transferir_stock(self, sku, cant, origen, destino, mot=""):
+        ok, msg = self.db.transferir_stock(sku, cant, origen, destino, mot)
+        if ok:
+            self._invalidar_cache('stock_ubicacion', sku)
+            self.historico.registrar_movimiento()
+        return ok, msg
     
+    def obtener_ubicaciones(self): return self.db.obtener_ubicaciones()
+    def agregar_ubicacion(self, nombre): return self.db.agregar_ubicacion(nombre)
     def obtener_kpis(self): return self.db.obtener_kpis()
+    def obtener_kpis_por_ubicacion(self): return self.db.obtener_kpis_por_ubicacion()
+    def obtener_stock_por_ubicacion(self, sku=None): return self.db.obtener_stock_por_ubicacion(sku)
     def obtener_historial_movimientos(self, limit=10): return self.db.obtener_movimientos_recientes(limit)
     def obtener_historial_completo(self): return self.db.obtener_historial()
     def obtener_estadisticas_avanzadas(self): return self.db.obtener_estadisticas_avanzadas()
     def obtener_reporte_consolidado(self): return self.db.obtener_reporte_consolidado()
     
+    # --- Stock a una fecha (checkpoints) ---
+    def stock_a_fecha(self, fecha): return self.historico.stock_a_fecha(fecha)
+    def crear_checkpoint_stock(self): return self.db.crear_checkpoint_stock()
+    def obtener_checkpoints(self): return self.db.obtener_checkpoints()
+    
     # --- NumPy y Lógica ---
     def analizar_precios_numpy(self): return self.analizador_numpy.analizar_precios()
     def identificar_outliers_numpy(self): return self.analizador_numpy.identificar_outliers()
+    def clasificar_abc(self, criterio="valor", umbral_a=0.80, umbral_b=0.95): return self.clasificador_abc.clasificar(criterio, umbral_a, umbral_b)
     
     # --- PROGRAMACIÓN FUNCIONAL (MAP, FILTER, REDUCE) ---
 
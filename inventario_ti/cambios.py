@@ -0,0 +1,115 @@
+import select
+import threading
+import time
+import psycopg2
+import psycopg2.extensions
+from database import CANAL_CAMBIOS
+
+LOTE_CAMBIOS = 1000
+# Filas de 'cambios' más antiguas que esto se borran; un worker caído más tiempo no las necesita
+RETENCION_CAMBIOS_HORAS = 24
+# Claves de idempotencia: un cliente no reintenta pasado este plazo
+RETENCION_IDEMPOTENCIA_HORAS = 48
+INTERVALO_PURGA = 3600  # segundos
+# Tablas que publican en el feed: una invalidación completa avisa de todas
+TABLAS_FEED = ('productos', 'stock_ubicacion', 'movimientos', 'usuarios', 'ubicaciones')
+
+class FeedCambios:
+    """
+    Avisa a este worker de los cambios hechos por cualquier otro.
+    Postgres: LISTEN/NOTIFY. SQLite: sondeo del contador de la tabla 'cambios'.
+    """
+    def __init__(self, db, intervalo=1.0):
+        self.db = db
+        self.intervalo = intervalo
+        self.ultimo_id = db.obtener_ultimo_cambio()
+        self._suscriptores = []
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo = None
+        self._ultima_purga = time.monotonic()
+
+    def suscribir(self, callback, tablas=None):
+        # callback(tabla, sku) -> sku es None cuando cambia la tabla completa
+        self._suscriptores.append((callback, set(tablas) if tablas else None))
+
+    def iniciar(self):
+        if self._hilo and self._hilo.is_alive(): return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="feed-cambios", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+        if self._hilo: self._hilo.join(timeout=self.intervalo * 2)
+
+    def sondear(self):
+        """Procesa los cambios pendientes según el contador. Devuelve cuántos se despacharon."""
+        total = 0
+        with self._lock:
+            # Se sigue leyendo hasta vaciar la cola: bajo carga no se acumula retraso
+            while True:
+                cambios = self.db.obtener_cambios_desde(self.ultimo_id, LOTE_CAMBIOS)
+                for c in cambios:
+                    self._despachar(int(c['id']), c['tabla'], c['sku'])
+                total += len(cambios)
+                if len(cambios) < LOTE_CAMBIOS: return total
+
+    def invalidar_todo(self):
+        """Avisa de un cambio completo (sku None) en todas las tablas: para cuando pudo perderse algún aviso."""
+        with self._lock:
+            for tabla in TABLAS_FEED: self._notificar(tabla, None)
+
+    def _despachar(self, id_cambio, tabla, sku):
+        # Llamar con self._lock tomado. Invalidar dos veces es inocuo, saltarse un cambio no.
+        self.ultimo_id = max(self.ultimo_id, id_cambio)
+        self._notificar(tabla, sku)
+
+    def _notificar(self, tabla, sku):
+        for callback, tablas in self._suscriptores:
+            if tablas is None or tabla in tablas:
+                try:
+                    callback(tabla, sku or None)
+                except Exception as e:
+                    print(f"Error en suscriptor de cambios: {e}")
+
+    def _bucle(self):
+        while not self._detener.is_set():
+            try:
+                if self.db.database_url:
+                    self._escuchar_postgres()
+                else:
+                    self.sondear()
+                    self._purgar_si_corresponde()
+            except Exception as e:
+                print(f"Error en feed de cambios: {e}")
+            self._detener.wait(self.intervalo)
+
+    def _purgar_si_corresponde(self):
+        if time.monotonic() - self._ultima_purga < INTERVALO_PURGA: return
+        self._ultima_purga = time.monotonic()
+        self.db.purgar_cambios(RETENCION_CAMBIOS_HORAS)
+        self.db.purgar_idempotencia(RETENCION_IDEMPOTENCIA_HORAS)
+
+    def _escuchar_postgres(self):
+        conn = psycopg2.connect(self.db.database_url)
+        try:
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            conn.cursor().execute(f"LISTEN {CANAL_CAMBIOS}")
+            # Lo confirmado mientras no escuchábamos no se puede recuperar por contador: los ids
+            # de Postgres se confirman desordenados y ultimo_id ya avanzó con los NOTIFY. Tras cada
+            # (re)conexión se invalida todo; a partir de aquí LISTEN no pierde avisos.
+            self.invalidar_todo()
+            while not self._detener.is_set():
+                self._purgar_si_corresponde()
+                if select.select([conn], [], [], self.intervalo) == ([], [], []): continue
+                conn.poll()
+                with self._lock:
+                    while conn.notifies:
+                        aviso = conn.notifies.pop(0)
+                        # En Postgres los ids pueden llegar desordenados (orden de commit),
+                        # así que cada NOTIFY se despacha sin filtrar por el contador
+                        id_cambio, tabla, sku = aviso.payload.split(':', 2)
+                        self._despachar(int(id_cambio), tabla, sku)
+        finally:
+            conn.close()
@@ -0,0 +1,67 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+def _peticion(conn, metodo, ruta, cuerpo=None, cabeceras=None):
+    cabeceras = {"Content-Type": "application/json", **(cabeceras or {})}
+    conn.request(metodo, ruta, body=json.dumps(cuerpo) if cuerpo is not None else None, headers=cabeceras)
+    resp = conn.getresponse()
+    resp.read()
+    return resp.status
+
+def _trabajador(url, skus, escenario, fin, resultados, token):
+    destino = urlparse(url)
+    conn = http.client.HTTPConnection(destino.hostname, destino.port or 80, timeout=30)  # keep-alive
+    auth = {"Authorization": f"Bearer {token}"} if token else {}
+    while time.monotonic() < fin:
+        sku = random.choice(skus)
+        inicio = time.perf_counter()
+        try:
+            if escenario == "lectura" or (escenario == "mixto" and random.random() < 0.8):
+                estado = _peticion(conn, "GET", f"/productos/{sku}", cabeceras=auth)
+            else:
+                mov = {"sku": sku, "cantidad": 1, "tipo": random.choice(["entrada", "salida"]), "motivo": "carga"}
+                estado = _peticion(conn, "POST", "/movimientos", mov, {**auth, "Idempotency-Key": str(uuid.uuid4())})
+        except Exception:
+            conn.close()
+            estado = 0
+        resultados.append((time.perf_counter() - inicio, estado))
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga local de la API de inventario")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--hilos", type=int, default=16)
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--escenario", choices=["lectura", "escritura", "mixto"], default="mixto")
+    parser.add_argument("--token", default=os.getenv("API_TOKEN"), help="Por defecto, la variable API_TOKEN")
+    args = parser.parse_args()
+
+    destino = urlparse(args.url)
+    conn = http.client.HTTPConnection(destino.hostname, destino.port or 80, timeout=30)
+    conn.request("GET", "/productos?limit=1000", headers={"Authorization": f"Bearer {args.token}"} if args.token else {})
+    skus = [p["sku"] for p in json.loads(conn.getresponse().read())]
+    if not skus:
+        print("No hay productos para probar")
+        return
+
+    resultados = []
+    fin = time.monotonic() + args.segundos
+    hilos = [threading.Thread(target=_trabajador, args=(args.url, skus, args.escenario, fin, resultados, args.token)) for _ in range(args.hilos)]
+    for h in hilos: h.start()
+    for h in hilos: h.join()
+
+    latencias = sorted(r[0] for r in resultados)
+    errores = sum(1 for r in resultados if r[1] == 0 or r[1] >= 500)
+    p = lambda q: latencias[min(len(latencias) - 1, int(q * len(latencias)))] * 1000
+    print(f"Escenario: {args.escenario} | hilos: {args.hilos} | duración: {args.segundos}s")
+    print(f"Peticiones: {len(resultados)} | req/s: {len(resultados) / args.segundos:,.1f} | errores: {errores}")
+    print(f"Latencia ms -> p50: {p(0.50):.1f} | p95: {p(0.95):.1f} | p99: {p(0.99):.1f}")
+
+if __name__ == "__main__":
+    main()
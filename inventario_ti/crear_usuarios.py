@@ -1,46 +1,63 @@
-import json
+import argparse
 import hashlib
 from datetime import datetime
+from database import DatabaseManager
+
+# Los usuarios viven en la BD (tabla usuarios). usuarios.json solo se lee una vez, para
+# sembrar una BD vacía; para altas o cambios de contraseña usar este script.
+
+def _usuario(contrasena, nombre, rol, avatar):
+    return {
+        "contrasena_hash": hashlib.sha256(contrasena.encode()).hexdigest(),
+        "nombre": nombre,
+        "rol": rol,
+        "avatar": avatar,
+        "fecha_creacion": datetime.now().strftime("%Y-%m-%d")
+    }
+
+def crear_usuarios_iniciales(db):
+    """Crea (o restablece) los usuarios iniciales en la BD"""
 
-def crear_usuarios_iniciales():
-    """Crea el archivo de usuarios inicial"""
-    
     usuarios = {
-        "admin": {
-            "contrasena_hash": hashlib.sha256("admin123".encode()).hexdigest(),
-            "nombre": "Administrador Principal",
-            "rol": "admin",
-            "avatar": "👑",
-            "fecha_creacion": datetime.now().strftime("%Y-%m-%d"),
-            "fecha_ultimo_acceso": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        },
-        "supervisor": {
-            "contrasena_hash": hashlib.sha256("sup123".encode()).hexdigest(),
-            "nombre": "Supervisor de Inventario TI",
-            "rol": "supervisor",
-            "avatar": "👨‍💼",
-            "fecha_creacion": datetime.now().strftime("%Y-%m-%d"),
-            "fecha_ultimo_acceso": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        },
-        "milagros": {
-            "contrasena_hash": hashlib.sha256("mila123".encode()).hexdigest(),
-            "nombre": "Milagros",
-            "rol": "supervisor",
-            "avatar": "👩‍💼",
-            "fecha_creacion": datetime.now().strftime("%Y-%m-%d"),
-            "fecha_ultimo_acceso": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
+        "admin": _usuario("admin123", "Administrador Principal", "admin", "👑"),
+        "supervisor": _usuario("sup123", "Supervisor de Inventario TI", "supervisor", "👨‍💼"),
+        "milagros": _usuario("mila123", "Milagros", "supervisor", "👩‍💼")
     }
-    
-    with open("usuarios.json", "w") as f:
-        json.dump(usuarios, f, indent=4)
-    
-    print("✅ Archivo de usuarios creado exitosamente!")
+
+    if not db.guardar_usuarios(usuarios, sobrescribir=True):
+        print("❌ No se pudieron guardar los usuarios")
+        return
+
+    print("✅ Usuarios creados exitosamente!")
     print("\n🔑 Credenciales iniciales:")
     print("   👑 Administrador: usuario: admin | contraseña: admin123")
     print("   👨‍💼 Supervisor: usuario: supervisor | contraseña: sup123")
     print("   👩‍💼 Milagros: usuario: milagros | contraseña: mila123")
-    print("   👩‍💼 Gabriel: usuario: gabo | contraseña: gabo123")
+
+def guardar_usuario(db, usuario, contrasena, nombre, rol, avatar):
+    """Alta de un usuario, o cambio de contraseña y datos si ya existe"""
+    # Lo que no se indique se conserva del usuario existente
+    existente = next((u for u in db.obtener_usuarios() if u['usuario'] == usuario), {})
+    nombre = nombre or existente.get('nombre') or usuario
+    rol = rol or existente.get('rol') or "supervisor"
+    avatar = avatar or existente.get('avatar') or "👤"
+    if db.guardar_usuarios({usuario: _usuario(contrasena, nombre, rol, avatar)}, sobrescribir=True):
+        print(f"✅ Usuario '{usuario}' guardado")
+    else:
+        print(f"❌ No se pudo guardar el usuario '{usuario}'")
 
 if __name__ == "__main__":
-    crear_usuarios_iniciales()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Alta y reseteo de usuarios en la BD (sin argumentos: usuarios iniciales)")
+    parser.add_argument("--usuario")
+    parser.add_argument("--contrasena")
+    parser.add_argument("--nombre")
+    parser.add_argument("--rol", choices=["admin", "supervisor"])
+    parser.add_argument("--avatar")
+    args = parser.parse_args()
+
+    db = DatabaseManager()
+    if args.usuario:
+        if not args.contrasena: parser.error("--contrasena es obligatoria con --usuario")
+        guardar_usuario(db, args.usuario, args.contrasena, args.nombre, args.rol, args.avatar)
+    else:
+        crear_usuarios_iniciales(db)
@@ -1,25 +1,107 @@
 import os
+import json
+import time
+import hashlib
+import random
 import sqlite3
+import threading
 import psycopg2
+import psycopg2.pool
 import pandas as pd
 from datetime import datetime
 
+# Canal de Postgres por el que se avisan los cambios a los demás workers
+CANAL_CAMBIOS = "inventario_cambios"
+
+# El stock "central" es el de productos.stock; el resto vive en stock_ubicacion
+UBICACION_CENTRAL = "CENTRAL"
+
+# Stock total por producto = central + suma de ubicaciones (lo que leen KPIs y reportes)
+VISTA_PRODUCTOS = """SELECT p.id, p.sku, p.nombre, p.categoria, p.marca, p.precio_compra, p.precio_venta,
+    p.stock + COALESCE(u.stock, 0) AS stock, p.stock_minimo, p.fecha_creacion, p.fecha_actualizacion, p.stock AS stock_central
+    FROM productos p LEFT JOIN (SELECT sku, SUM(stock) AS stock FROM stock_ubicacion GROUP BY sku) u ON u.sku = p.sku"""
+
+# Perfiles de motor SQLite (variable SQLITE_PERFIL). "concurrente" usa WAL para que
+# los lectores no bloqueen a los escritores entre sesiones de Streamlit.
+PERFILES_SQLITE = {
+    "basico": {},
+    "concurrente": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000,       # KiB (negativo) -> ~64 MB por conexión
+        "mmap_size": 268435456,     # 256 MB
+        "busy_timeout": 5000,       # ms esperando el lock antes de fallar
+        "wal_autocheckpoint": 1000, # páginas
+        "temp_store": "MEMORY",
+    },
+}
+
+# Reintentos ante conflictos de escritura (SQLite locked/busy, Postgres deadlock/serialización)
+REINTENTOS_ESCRITURA = 5
+ESPERA_BASE_REINTENTO = 0.05  # segundos, se duplica en cada intento
+INTERVALO_CHECKPOINT_WAL = 300  # segundos
+
+# Conexiones reutilizables por proceso (Postgres); SQLite reusa una conexión por hilo
+POOL_MAX_CONEXIONES = int(os.getenv("DB_POOL_MAX", "10"))
+# Mensajes de fallo transitorio: la misma operación puede reintentarse más tarde
+ERROR_CONEXION = "Error de conexión"
+ERROR_BD_OCUPADA = "Base de datos ocupada: reintentos agotados"
+
+class OperacionRechazada(Exception):
+    """Un paso de la transacción no afectó filas (p.ej. stock insuficiente): se revierte todo"""
+    pass
+
 class DatabaseManager:
-    def __init__(self):
+    def __init__(self, ruta_sqlite="inventario_ti.db", perfil_sqlite=None):
         # Detectar si estamos en Render (Nube) o Local
         self.database_url = os.getenv("DATABASE_URL")
+        self.ruta_sqlite = ruta_sqlite
+        self.perfil_sqlite = PERFILES_SQLITE[perfil_sqlite or os.getenv("SQLITE_PERFIL", "concurrente")]
+        self._ultimo_checkpoint_wal = time.monotonic()
+        self._pool = None
+        self._cupos_pool = threading.BoundedSemaphore(POOL_MAX_CONEXIONES)
+        self._conexion_hilo = threading.local()
         self._inicializar_bd()
     
     def _get_connection(self):
         try:
             if self.database_url:
-                return psycopg2.connect(self.database_url)
+                # ThreadedConnectionPool falla si se agota: el semáforo hace esperar en su lugar
+                self._cupos_pool.acquire()
+                try:
+                    if self._pool is None:
+                        # Sesiones en UTC: CURRENT_TIMESTAMP se guarda igual que en SQLite
+                        self._pool = psycopg2.pool.ThreadedConnectionPool(1, POOL_MAX_CONEXIONES, self.database_url, options="-c timezone=UTC")
+                    return self._pool.getconn()
+                except Exception:
+                    self._cupos_pool.release()
+                    raise
             else:
-                return sqlite3.connect("inventario_ti.db")
+                conn = getattr(self._conexion_hilo, 'conn', None)
+                if conn is None:
+                    conn = self._conexion_hilo.conn = self._conectar_sqlite()
+                return conn
         except Exception as e:
             print(f"Error de conexión: {e}")
             return None
 
+    def _liberar_conexion(self, conn):
+        # Devuelve la conexión al pool en lugar de cerrarla
+        if self.database_url:
+            self._pool.putconn(conn, close=bool(conn.closed))
+            self._cupos_pool.release()
+        elif conn.in_transaction:
+            conn.rollback()
+
+    def _conectar_sqlite(self):
+        if not self.perfil_sqlite: return sqlite3.connect(self.ruta_sqlite)
+        # Autocommit: las escrituras abren su transacción con BEGIN IMMEDIATE (ver _ejecutar_transaccion)
+        conn = sqlite3.connect(self.ruta_sqlite, timeout=self.perfil_sqlite["busy_timeout"] / 1000, isolation_level=None)
+        for pragma, valor in self.perfil_sqlite.items():
+            # journal_mode queda grabado en el archivo; se fija una vez en _inicializar_bd
+            if pragma != "journal_mode": conn.execute(f"PRAGMA {pragma} = {valor}")
+        return conn
+
     def _inicializar_bd(self):
         conn = self._get_connection()
         if not conn: return
@@ -32,30 +114,55 @@ class DatabaseManager:
                     cursor.execute('CREATE TABLE IF NOT EXISTS productos (id SERIAL PRIMARY KEY, sku TEXT UNIQUE, nombre TEXT, categoria TEXT, marca TEXT, precio_compra REAL, precio_venta REAL, stock INTEGER, stock_minimo INTEGER DEFAULT 5, fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP, fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
                     cursor.execute('CREATE TABLE IF NOT EXISTS movimientos (id SERIAL PRIMARY KEY, sku TEXT, tipo TEXT, cantidad INTEGER, motivo TEXT, fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
                     cursor.execute('CREATE TABLE IF NOT EXISTS historial (id SERIAL PRIMARY KEY, accion TEXT, detalle TEXT, fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
+                    cursor.execute('CREATE TABLE IF NOT EXISTS cambios (id BIGSERIAL PRIMARY KEY, tabla TEXT, sku TEXT, fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
+                    cursor.execute('CREATE TABLE IF NOT EXISTS stock_ubicacion (sku TEXT, ubicacion TEXT, stock INTEGER DEFAULT 0, PRIMARY KEY (sku, ubicacion))')
+                    cursor.execute('ALTER TABLE movimientos ADD COLUMN IF NOT EXISTS ubicacion TEXT')
+                    cursor.execute("SELECT 1 FROM information_schema.columns WHERE table_name = 'movimientos' AND column_name = 'transferencia'")
+                    nueva_transferencia = cursor.fetchone() is None
+                    if nueva_transferencia: cursor.execute('ALTER TABLE movimientos ADD COLUMN transferencia INTEGER DEFAULT 0')
+                    cursor.execute(f'CREATE OR REPLACE VIEW vista_productos AS {VISTA_PRODUCTOS}')
+                    cursor.execute('CREATE TABLE IF NOT EXISTS checkpoints_stock (id SERIAL PRIMARY KEY, fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP, ultimo_movimiento INTEGER)')
                 else:
                     # SQLite
+                    if "journal_mode" in self.perfil_sqlite:
+                        cursor.execute(f'PRAGMA journal_mode = {self.perfil_sqlite["journal_mode"]}')
                     cursor.execute('CREATE TABLE IF NOT EXISTS productos (id INTEGER PRIMARY KEY AUTOINCREMENT, sku TEXT UNIQUE, nombre TEXT, categoria TEXT, marca TEXT, precio_compra REAL, precio_venta REAL, stock INTEGER, stock_minimo INTEGER DEFAULT 5, fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP, fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
                     cursor.execute('CREATE TABLE IF NOT EXISTS movimientos (id INTEGER PRIMARY KEY AUTOINCREMENT, sku TEXT, tipo TEXT, cantidad INTEGER, motivo TEXT, fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
                     cursor.execute('CREATE TABLE IF NOT EXISTS historial (id INTEGER PRIMARY KEY AUTOINCREMENT, accion TEXT, detalle TEXT, fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
+                    cursor.execute('CREATE TABLE IF NOT EXISTS cambios (id INTEGER PRIMARY KEY AUTOINCREMENT, tabla TEXT, sku TEXT, fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
+                    cursor.execute('CREATE TABLE IF NOT EXISTS stock_ubicacion (sku TEXT, ubicacion TEXT, stock INTEGER DEFAULT 0, PRIMARY KEY (sku, ubicacion))')
+                    columnas = [c[1] for c in cursor.execute('PRAGMA table_info(movimientos)').fetchall()]
+                    if 'ubicacion' not in columnas: cursor.execute('ALTER TABLE movimientos ADD COLUMN ubicacion TEXT')
+                    nueva_transferencia = 'transferencia' not in columnas
+                    if nueva_transferencia: cursor.execute('ALTER TABLE movimientos ADD COLUMN transferencia INTEGER DEFAULT 0')
+                    cursor.execute('DROP VIEW IF EXISTS vista_productos')
+                    cursor.execute(f'CREATE VIEW vista_productos AS {VISTA_PRODUCTOS}')
+                    cursor.execute('CREATE TABLE IF NOT EXISTS checkpoints_stock (id INTEGER PRIMARY KEY AUTOINCREMENT, fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP, ultimo_movimiento INTEGER)')
+                # Comunes a ambos motores
+                if nueva_transferencia:
+                    # Transferencias anteriores a la columna: solo reconocibles por el motivo por defecto
+                    cursor.execute("UPDATE movimientos SET transferencia = 1 WHERE motivo LIKE 'Transferencia %'")
+                cursor.execute('CREATE TABLE IF NOT EXISTS checkpoint_stock_detalle (checkpoint_id INTEGER, sku TEXT, stock INTEGER, PRIMARY KEY (checkpoint_id, sku))')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_movimientos_fecha ON movimientos (fecha)')
+                cursor.execute('CREATE TABLE IF NOT EXISTS idempotencia (clave TEXT PRIMARY KEY, resultado TEXT, huella TEXT, fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
+                if self.database_url:
+                    cursor.execute('ALTER TABLE idempotencia ADD COLUMN IF NOT EXISTS huella TEXT')
+                elif 'huella' not in [c[1] for c in cursor.execute('PRAGMA table_info(idempotencia)').fetchall()]:
+                    cursor.execute('ALTER TABLE idempotencia ADD COLUMN huella TEXT')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_idempotencia_fecha ON idempotencia (fecha)')
+                cursor.execute('CREATE TABLE IF NOT EXISTS usuarios (usuario TEXT PRIMARY KEY, contrasena_hash TEXT, nombre TEXT, rol TEXT, avatar TEXT, fecha_creacion TEXT, fecha_ultimo_acceso TEXT)')
+                # Catálogo de ubicaciones válidas (además de CENTRAL). Se siembra con las que ya tienen stock.
+                cursor.execute('CREATE TABLE IF NOT EXISTS ubicaciones (nombre TEXT PRIMARY KEY, fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
+                cursor.execute('INSERT INTO ubicaciones (nombre) SELECT DISTINCT ubicacion FROM stock_ubicacion WHERE ubicacion IS NOT NULL ON CONFLICT (nombre) DO NOTHING')
         except Exception as e:
             print(f"Error init BD: {e}")
         finally:
-            conn.close()
+            self._liberar_conexion(conn)
 
-    def _ejecutar_consulta(self, query, params=()):
-        conn = self._get_connection()
-        if not conn: return False
-        try:
-            if self.database_url: query = query.replace('?', '%s')
-            with conn:
-                with conn.cursor() as cursor:
-                    cursor.execute(query, params)
-            return True
-        except Exception as e:
-            print(f"Error SQL: {e}")
-            return False
-        finally:
-            conn.close()
+    def _ejecutar_consulta(self, query, params=(), cambio=None):
+        # cambio = (tabla, sku): se registra en el feed dentro de la misma transacción
+        ok, _ = self._ejecutar_transaccion([(query, params, None)], cambios=[cambio] if cambio else ())
+        return ok
 
     def _leer_datos(self, query, params=()):
         conn = self._get_connection()
@@ -70,48 +177,269 @@ class DatabaseManager:
             print(f"Error lectura: {e}")
             return pd.DataFrame()
         finally:
-            conn.close()
+            self._liberar_conexion(conn)
+
+    def _ejecutar_transaccion(self, pasos, cambios=()):
+        # pasos = [(query, params, error)]: si un paso con 'error' no afecta filas, se revierte todo
+        for intento in range(REINTENTOS_ESCRITURA + 1):
+            conn = self._get_connection()
+            if not conn: return False, ERROR_CONEXION
+            try:
+                with conn:
+                    cursor = conn.cursor()
+                    # Tomar el lock de escritura al inicio evita fallar a mitad de la transacción
+                    if not self.database_url and self.perfil_sqlite: cursor.execute("BEGIN IMMEDIATE")
+                    for query, params, error in pasos:
+                        if self.database_url: query = query.replace('?', '%s')
+                        cursor.execute(query, params)
+                        if error and cursor.rowcount == 0: raise OperacionRechazada(error)
+                    for tabla, sku in cambios: self._registrar_cambio(cursor, tabla, sku)
+                self._checkpoint_periodico()
+                return True, ""
+            except OperacionRechazada as e:
+                return False, str(e)
+            except Exception as e:
+                conflicto = self._es_conflicto_escritura(e)
+                if intento < REINTENTOS_ESCRITURA and conflicto:
+                    # Backoff exponencial con jitter para que los workers no reintenten a la vez
+                    time.sleep(ESPERA_BASE_REINTENTO * (2 ** intento) * random.uniform(0.5, 1.5))
+                    continue
+                print(f"Error SQL: {e}")
+                # Solo el conflicto persistente es transitorio; un error de SQL o esquema no se arregla reintentando
+                return False, ERROR_BD_OCUPADA if conflicto else "Error update"
+            finally:
+                self._liberar_conexion(conn)
+
+    def _es_conflicto_escritura(self, error):
+        if isinstance(error, sqlite3.OperationalError):
+            return "locked" in str(error) or "busy" in str(error)
+        # 40001 = serialization_failure, 40P01 = deadlock_detected
+        return getattr(error, "pgcode", None) in ("40001", "40P01")
+
+    def _checkpoint_periodico(self):
+        if self.database_url or self.perfil_sqlite.get("journal_mode") != "WAL": return
+        if time.monotonic() - self._ultimo_checkpoint_wal < INTERVALO_CHECKPOINT_WAL: return
+        self._ultimo_checkpoint_wal = time.monotonic()
+        self.checkpoint_wal()
+
+    def checkpoint_wal(self, modo="PASSIVE"):
+        """Vuelca el WAL al archivo principal. PASSIVE no bloquea; TRUNCATE además lo vacía."""
+        if self.database_url: return None
+        conn = self._get_connection()
+        if not conn: return None
+        try:
+            return conn.execute(f"PRAGMA wal_checkpoint({modo})").fetchone()
+        except Exception as e:
+            print(f"Error checkpoint WAL: {e}")
+            return None
+        finally:
+            self._liberar_conexion(conn)
+
+    def _registrar_cambio(self, cursor, tabla, sku=None):
+        # El contador (id) es monotónico: SQLite lo sondea, Postgres además avisa por NOTIFY
+        if self.database_url:
+            cursor.execute("INSERT INTO cambios (tabla, sku) VALUES (%s,%s) RETURNING id", (tabla, sku))
+            id_cambio = cursor.fetchone()[0]
+            cursor.execute("SELECT pg_notify(%s, %s)", (CANAL_CAMBIOS, f"{id_cambio}:{tabla}:{sku or ''}"))
+        else:
+            cursor.execute("INSERT INTO cambios (tabla, sku) VALUES (?,?)", (tabla, sku))
+
+    # --- FEED DE CAMBIOS ---
+
+    def obtener_ultimo_cambio(self):
+        df = self._leer_datos("SELECT COALESCE(MAX(id), 0) AS ultimo FROM cambios")
+        return int(df.iloc[0]['ultimo']) if not df.empty else 0
+
+    def obtener_cambios_desde(self, ultimo_id, limit=1000):
+        df = self._leer_datos("SELECT id, tabla, sku FROM cambios WHERE id > ? ORDER BY id LIMIT ?", (ultimo_id, limit))
+        return df.to_dict('records') if not df.empty else []
+
+    def purgar_cambios(self, horas):
+        return self._purgar_antiguos('cambios', horas)
+
+    def purgar_idempotencia(self, horas):
+        # Pasado este plazo un reintento con la misma clave se trata como operación nueva
+        return self._purgar_antiguos('idempotencia', horas)
+
+    def _purgar_antiguos(self, tabla, horas):
+        if self.database_url:
+            q = f"DELETE FROM {tabla} WHERE fecha < CURRENT_TIMESTAMP - (? * INTERVAL '1 hour')"
+        else:
+            q = f"DELETE FROM {tabla} WHERE fecha < datetime('now', '-' || ? || ' hours')"
+        return self._ejecutar_consulta(q, (horas,))
 
     # --- FUNCIONES PRINCIPALES ---
 
-    def obtener_productos(self, busqueda=""):
+    def obtener_productos(self, busqueda="", limit=None):
+        # limit se aplica en SQL: la API no debe leer todo el catálogo para devolver una página
+        tope, tope_params = (" LIMIT ?", (int(limit),)) if limit else ("", ())
         if busqueda:
-            query = "SELECT * FROM productos WHERE sku LIKE ? OR nombre LIKE ? OR marca LIKE ? ORDER BY nombre"
+            query = "SELECT * FROM vista_productos WHERE sku LIKE ? OR nombre LIKE ? OR marca LIKE ? ORDER BY nombre" + tope
             term = f"%{busqueda}%"
-            df = self._leer_datos(query, (term, term, term))
+            df = self._leer_datos(query, (term, term, term) + tope_params)
         else:
-            df = self._leer_datos("SELECT * FROM productos ORDER BY nombre")
+            df = self._leer_datos("SELECT * FROM vista_productos ORDER BY nombre" + tope, tope_params)
         
         # IMPORTANTE: Devolvemos lista de diccionarios para compatibilidad
         return df.to_dict('records') if not df.empty else []
 
+    def obtener_producto(self, sku):
+        df = self._leer_datos("SELECT * FROM vista_productos WHERE sku = ?", (sku,))
+        return df.to_dict('records')[0] if not df.empty else None
+
     def exportar_a_dataframe(self):
         # Esta funcion SÍ devuelve DataFrame puro
-        return self._leer_datos("SELECT * FROM productos ORDER BY nombre")
+        return self._leer_datos("SELECT * FROM vista_productos ORDER BY nombre")
 
     def agregar_producto(self, sku, nombre, cat, marca, pc, pv, stock, min_stock=5):
         q = "INSERT INTO productos (sku, nombre, categoria, marca, precio_compra, precio_venta, stock, stock_minimo) VALUES (?,?,?,?,?,?,?,?)"
-        if self._ejecutar_consulta(q, (sku, nombre, cat, marca, pc, pv, stock, min_stock)):
+        pasos = [(q, (sku, nombre, cat, marca, pc, pv, stock, min_stock), None)]
+        # El stock inicial también queda en movimientos: el log completo permite reconstruir a una fecha
+        if stock: pasos.append(("INSERT INTO movimientos (sku, tipo, cantidad, motivo) VALUES (?,?,?,?)", (sku, 'entrada', stock, 'Stock inicial'), None))
+        if self._ejecutar_transaccion(pasos, cambios=[('productos', sku)])[0]:
             self._historial('creacion', f'Creado {sku}')
             return True, "Producto creado"
         return False, "Error: SKU duplicado"
 
-    def actualizar_stock(self, sku, cant, tipo, motivo=""):
-        df = self._leer_datos("SELECT stock FROM productos WHERE sku = ?", (sku,))
-        if df.empty: return False, "No existe producto"
+    def actualizar_stock(self, sku, cant, tipo, motivo="", ubicacion=None, clave_idempotencia=None):
+        return self.registrar_movimientos_lote([{'sku': sku, 'cantidad': cant, 'tipo': tipo, 'motivo': motivo, 'ubicacion': ubicacion}], clave_idempotencia)
+
+    def registrar_movimientos_lote(self, movimientos, clave_idempotencia=None):
+        """
+        Aplica todos los movimientos en una sola transacción (todo o nada).
+        Con clave_idempotencia, un reintento de la misma operación devuelve el resultado original;
+        si la clave ya se usó con otros movimientos se rechaza con "Clave de idempotencia reutilizada".
+        """
+        if not movimientos: return False, "Sin movimientos"
+        huella = self._huella_movimientos(movimientos) if clave_idempotencia else None
+        if clave_idempotencia:
+            previo = self._resultado_idempotente(clave_idempotencia, huella)
+            if previo: return previo
+        
+        skus = sorted({m['sku'] for m in movimientos})
+        existentes = self._leer_datos(f"SELECT sku FROM productos WHERE sku IN ({','.join('?' * len(skus))})", tuple(skus))
+        faltantes = set(skus) - set(existentes['sku'] if not existentes.empty else [])
+        if faltantes: return False, "No existe producto" if len(movimientos) == 1 else f"No existe producto: {', '.join(sorted(faltantes))}"
+        
+        desconocidas = self._ubicaciones_desconocidas(m.get('ubicacion') for m in movimientos)
+        if desconocidas: return False, f"No existe ubicación: {', '.join(desconocidas)}"
         
-        actual = df.iloc[0]['stock']
-        nuevo = actual + cant if tipo == 'entrada' else actual - cant
-        if nuevo < 0: return False, "Stock insuficiente"
+        pasos, cambios, detalle = [], set(), []
+        for m in movimientos:
+            sku, cant, tipo = m['sku'], m['cantidad'], m['tipo']
+            ubicacion = self._normalizar_ubicacion(m.get('ubicacion'))
+            delta = cant if tipo == 'entrada' else -cant
+            # Chequeo y escritura en una sola sentencia condicional: sin carreras ni sobreventa
+            for q, params, error in self._pasos_stock(sku, delta, ubicacion):
+                pasos.append((q, params, error if len(movimientos) == 1 or not error else f"{error} ({sku})"))
+            pasos.append(("INSERT INTO movimientos (sku, tipo, cantidad, motivo, ubicacion) VALUES (?,?,?,?,?)", (sku, tipo, cant, m.get('motivo', ''), ubicacion), None))
+            cambios.update({(self._tabla_stock(ubicacion), sku), ('movimientos', sku)})
+            detalle.append(f'{tipo} {cant} unid. {sku}' + (f' en {ubicacion}' if ubicacion else ''))
         
-        if self._ejecutar_consulta("UPDATE productos SET stock = ? WHERE sku = ?", (nuevo, sku)):
-            self._ejecutar_consulta("INSERT INTO movimientos (sku, tipo, cantidad, motivo) VALUES (?,?,?,?)", (sku, tipo, cant, motivo))
-            self._historial('movimiento', f'{tipo} {cant} unid. {sku}')
-            return True, "Stock actualizado"
-        return False, "Error update"
+        resultado = "Stock actualizado" if len(movimientos) == 1 else f"{len(movimientos)} movimientos registrados"
+        accion = 'movimiento' if len(movimientos) == 1 else 'lote'
+        # La bitácora y la clave van en la misma transacción: una sola escritura por operación
+        pasos.append(("INSERT INTO historial (accion, detalle) VALUES (?,?)", (accion, '; '.join(detalle)), None))
+        if clave_idempotencia:
+            pasos.append(("INSERT INTO idempotencia (clave, resultado, huella) VALUES (?,?,?)", (clave_idempotencia, resultado, huella), None))
+        ok, msg = self._ejecutar_transaccion(pasos, cambios=sorted(cambios))
+        if ok: return True, resultado
+        if clave_idempotencia:
+            # Dos reintentos simultáneos: el que perdió la carrera choca con la clave ya registrada
+            previo = self._resultado_idempotente(clave_idempotencia, huella)
+            if previo: return previo
+        return False, msg
+
+    def _huella_movimientos(self, movimientos):
+        # Hash de la petición normalizada: misma clave + mismos movimientos = reintento legítimo
+        normalizados = [{'sku': m['sku'], 'cantidad': int(m['cantidad']), 'tipo': m['tipo'], 'motivo': m.get('motivo') or '',
+                         'ubicacion': self._normalizar_ubicacion(m.get('ubicacion'))} for m in movimientos]
+        return hashlib.sha256(json.dumps(normalizados, sort_keys=True).encode()).hexdigest()
+
+    def _resultado_idempotente(self, clave, huella):
+        # (ok, msg) si la clave ya existe; None si es nueva. Claves anteriores a la huella se aceptan tal cual.
+        df = self._leer_datos("SELECT resultado, huella FROM idempotencia WHERE clave = ?", (clave,))
+        if df.empty: return None
+        previa = df.iloc[0]['huella']
+        if isinstance(previa, str) and previa != huella: return False, "Clave de idempotencia reutilizada con otros movimientos"
+        return True, df.iloc[0]['resultado']
+
+    def transferir_stock(self, sku, cant, origen, destino, motivo=""):
+        origen, destino = self._normalizar_ubicacion(origen), self._normalizar_ubicacion(destino)
+        if cant <= 0: return False, "Cantidad inválida"
+        if origen == destino: return False, "Origen y destino son la misma ubicación"
+        if self._leer_datos("SELECT 1 FROM productos WHERE sku = ?", (sku,)).empty: return False, "No existe producto"
+        desconocidas = self._ubicaciones_desconocidas([origen, destino])
+        if desconocidas: return False, f"No existe ubicación: {', '.join(desconocidas)}"
+        
+        nombre_origen, nombre_destino = origen or UBICACION_CENTRAL, destino or UBICACION_CENTRAL
+        motivo = motivo or f"Transferencia {nombre_origen} -> {nombre_destino}"
+        # Se tocan las filas en orden fijo de ubicación para que dos transferencias cruzadas no se bloqueen entre sí
+        tramos = sorted([(origen, -cant), (destino, cant)], key=lambda t: t[0] or '')
+        pasos = [paso for ubic, delta in tramos for paso in self._pasos_stock(sku, delta, ubic)]
+        # Marcadas como transferencia: no son ventas ni compras (ver obtener_datos_abc)
+        pasos.append(("INSERT INTO movimientos (sku, tipo, cantidad, motivo, ubicacion, transferencia) VALUES (?,?,?,?,?,1)", (sku, 'salida', cant, motivo, origen), None))
+        pasos.append(("INSERT INTO movimientos (sku, tipo, cantidad, motivo, ubicacion, transferencia) VALUES (?,?,?,?,?,1)", (sku, 'entrada', cant, motivo, destino), None))
+        cambios = {(self._tabla_stock(origen), sku), (self._tabla_stock(destino), sku), ('movimientos', sku)}
+        ok, msg = self._ejecutar_transaccion(pasos, cambios=sorted(cambios))
+        if ok:
+            self._historial('transferencia', f'{cant} unid. {sku} {nombre_origen} -> {nombre_destino}')
+            return True, "Transferencia realizada"
+        return False, msg
+
+    def _normalizar_ubicacion(self, ubicacion):
+        ubicacion = (ubicacion or "").strip().upper()
+        return None if ubicacion in ("", UBICACION_CENTRAL) else ubicacion
+
+    def _ubicaciones_desconocidas(self, ubicaciones):
+        # Solo se mueve stock a ubicaciones dadas de alta: un error de tipeo no crea una sede fantasma
+        nombres = sorted({u for u in map(self._normalizar_ubicacion, ubicaciones) if u})
+        if not nombres: return []
+        df = self._leer_datos(f"SELECT nombre FROM ubicaciones WHERE nombre IN ({','.join('?' * len(nombres))})", tuple(nombres))
+        return sorted(set(nombres) - set(df['nombre'] if not df.empty else []))
+
+    def obtener_ubicaciones(self):
+        df = self._leer_datos("SELECT nombre FROM ubicaciones ORDER BY nombre")
+        return [UBICACION_CENTRAL] + (df['nombre'].tolist() if not df.empty else [])
+
+    def agregar_ubicacion(self, nombre):
+        nombre = self._normalizar_ubicacion(nombre)
+        if not nombre: return False, "Nombre de ubicación inválido"
+        if nombre in self.obtener_ubicaciones(): return False, "La ubicación ya existe"
+        if self._ejecutar_consulta("INSERT INTO ubicaciones (nombre) VALUES (?) ON CONFLICT (nombre) DO NOTHING", (nombre,), cambio=('ubicaciones', None)):
+            self._historial('ubicacion', f'Alta de ubicación {nombre}')
+            return True, f"Ubicación {nombre} creada"
+        return False, "Error al crear ubicación"
+
+    def _tabla_stock(self, ubicacion):
+        return 'stock_ubicacion' if ubicacion else 'productos'
+
+    def _pasos_stock(self, sku, delta, ubicacion):
+        if not ubicacion:
+            return [("UPDATE productos SET stock = stock + ? WHERE sku = ? AND stock + ? >= 0", (delta, sku, delta), "Stock insuficiente")]
+        if delta >= 0:
+            # Cada ubicación es su propia fila: sitios distintos nunca compiten por la misma
+            return [("INSERT INTO stock_ubicacion (sku, ubicacion, stock) VALUES (?,?,?) ON CONFLICT (sku, ubicacion) DO UPDATE SET stock = stock_ubicacion.stock + excluded.stock", (sku, ubicacion, delta), None)]
+        return [("UPDATE stock_ubicacion SET stock = stock + ? WHERE sku = ? AND ubicacion = ? AND stock + ? >= 0", (delta, sku, ubicacion, delta), f"Stock insuficiente en {ubicacion}")]
+
+    def obtener_stock_por_ubicacion(self, sku=None):
+        q = f"SELECT sku, ubicacion, stock FROM stock_ubicacion UNION ALL SELECT sku, '{UBICACION_CENTRAL}', stock FROM productos"
+        if sku:
+            df = self._leer_datos(f"SELECT * FROM ({q}) u WHERE sku = ? ORDER BY ubicacion", (sku,))
+        else:
+            df = self._leer_datos(f"SELECT * FROM ({q}) u ORDER BY sku, ubicacion")
+        return df.to_dict('records') if not df.empty else []
+
+    def obtener_kpis_por_ubicacion(self):
+        # Suma de todas las ubicaciones = KPIs a nivel producto (obtener_kpis)
+        q = f"""SELECT u.ubicacion, COUNT(*) AS items, SUM(u.stock) AS stock, SUM(u.stock * p.precio_compra) AS valor
+            FROM (SELECT sku, ubicacion, stock FROM stock_ubicacion UNION ALL SELECT sku, '{UBICACION_CENTRAL}', stock FROM productos) u
+            JOIN productos p ON p.sku = u.sku GROUP BY u.ubicacion ORDER BY u.ubicacion"""
+        df = self._leer_datos(q)
+        return df.to_dict('records') if not df.empty else []
 
     def obtener_kpis(self):
-        df = self._leer_datos("SELECT precio_compra, stock, stock_minimo FROM productos")
+        df = self._leer_datos("SELECT precio_compra, stock, stock_minimo FROM vista_productos")
         if df.empty: return {'total_items': 0, 'total_valor': 0, 'alertas': 0}
         return {
             'total_items': len(df),
@@ -129,8 +457,77 @@ class DatabaseManager:
         # Aseguramos que existe la función que daba error
         return self._leer_datos("SELECT * FROM historial ORDER BY fecha DESC LIMIT 50").to_dict('records')
 
+    # --- CHECKPOINTS DE STOCK (consultas a una fecha) ---
+
+    def crear_checkpoint_stock(self):
+        # Foto compacta (solo SKUs con stock) + último movimiento incluido, en una sola transacción
+        pasos = []
+        if self.database_url:
+            # Espera a los movimientos en curso y bloquea nuevos mientras se toma la foto
+            pasos.append(("LOCK TABLE movimientos IN SHARE ROW EXCLUSIVE MODE", (), None))
+        pasos.append(("INSERT INTO checkpoints_stock (ultimo_movimiento) SELECT COALESCE(MAX(id), 0) FROM movimientos", (), None))
+        pasos.append(("INSERT INTO checkpoint_stock_detalle (checkpoint_id, sku, stock) SELECT (SELECT MAX(id) FROM checkpoints_stock), sku, stock FROM vista_productos WHERE stock <> 0", (), None))
+        ok, msg = self._ejecutar_transaccion(pasos)
+        if ok:
+            self._historial('checkpoint', 'Checkpoint de stock creado')
+            return True, "Checkpoint creado"
+        return False, msg
+
+    def obtener_checkpoints(self):
+        df = self._leer_datos("SELECT id, fecha, ultimo_movimiento FROM checkpoints_stock ORDER BY id")
+        return df.to_dict('records') if not df.empty else []
+
+    def obtener_stock_checkpoint(self, checkpoint_id):
+        return self._leer_datos("SELECT sku, stock FROM checkpoint_stock_detalle WHERE checkpoint_id = ?", (checkpoint_id,))
+
+    def obtener_stock_actual(self, desde_id=None):
+        # Foto "en vivo": stock actual + id del último movimiento, leídos en una misma transacción.
+        # Con desde_id también devuelve los movimientos (desde_id, último] de esa misma foto: en Postgres
+        # un id menor puede confirmarse después, y leerlo aparte lo restaría de una base que no lo incluye.
+        conn = self._get_connection()
+        if not conn: return pd.DataFrame(), 0, pd.DataFrame()
+        try:
+            cursor = conn.cursor()
+            if self.database_url:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            else:
+                cursor.execute("BEGIN")
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM movimientos")
+            ultimo = int(cursor.fetchone()[0])
+            df = pd.read_sql_query("SELECT sku, stock FROM vista_productos", conn)
+            movs = pd.DataFrame()
+            if desde_id is not None:
+                q = "SELECT sku, tipo, cantidad FROM movimientos WHERE id > ? AND id <= ?"
+                movs = pd.read_sql_query(q.replace('?', '%s') if self.database_url else q, conn, params=(desde_id, ultimo))
+            conn.rollback()
+            return df, ultimo, movs
+        except Exception as e:
+            print(f"Error lectura: {e}")
+            return pd.DataFrame(), 0, pd.DataFrame()
+        finally:
+            self._liberar_conexion(conn)
+
+    def ultimo_movimiento(self):
+        df = self._leer_datos("SELECT COALESCE(MAX(id), 0) AS ultimo FROM movimientos")
+        return int(df.iloc[0]['ultimo']) if not df.empty else 0
+
+    def ultimo_movimiento_hasta(self, fecha):
+        df = self._leer_datos("SELECT COALESCE(MAX(id), 0) AS ultimo FROM movimientos WHERE fecha <= ?", (fecha,))
+        return int(df.iloc[0]['ultimo']) if not df.empty else 0
+
+    def obtener_movimientos_entre(self, desde_id, hasta_id):
+        # Movimientos con id en (desde_id, hasta_id]; solo las columnas necesarias para agregar
+        return self._leer_datos("SELECT sku, tipo, cantidad FROM movimientos WHERE id > ? AND id <= ?", (desde_id, hasta_id))
+
+    def obtener_datos_abc(self):
+        # Valor (stock total por producto) y volumen despachado por SKU en una sola consulta.
+        # Las transferencias entre ubicaciones no cuentan como despacho.
+        q = """SELECT p.sku, p.nombre, p.categoria, p.precio_compra, p.stock, COALESCE(m.volumen, 0) AS volumen
+            FROM vista_productos p LEFT JOIN (SELECT sku, SUM(cantidad) AS volumen FROM movimientos WHERE tipo = 'salida' AND COALESCE(transferencia, 0) = 0 GROUP BY sku) m ON m.sku = p.sku"""
+        return self._leer_datos(q)
+
     def obtener_estadisticas_avanzadas(self):
-        df = self._leer_datos("SELECT categoria, count(*) as cant, sum(stock) as st, sum(precio_compra*stock) as val FROM productos GROUP BY categoria")
+        df = self._leer_datos("SELECT categoria, count(*) as cant, sum(stock) as st, sum(precio_compra*stock) as val FROM vista_productos GROUP BY categoria")
         if df.empty: return {"por_categoria": {}}
         res = {}
         for _, r in df.iterrows():
@@ -140,5 +537,25 @@ class DatabaseManager:
     def obtener_reporte_consolidado(self):
         return {"resumen": self.obtener_kpis(), "categorias": self.obtener_estadisticas_avanzadas()["por_categoria"]}
 
+    # --- USUARIOS ---
+
+    def obtener_usuarios(self):
+        df = self._leer_datos("SELECT * FROM usuarios")
+        return df.to_dict('records') if not df.empty else []
+
+    def guardar_usuarios(self, usuarios, sobrescribir=False):
+        # Sin sobrescribir (migración inicial): DO NOTHING, si dos workers migran a la vez el segundo no falla.
+        # Sobrescribir (alta o reseteo): actualiza contraseña y datos, conserva creación y último acceso.
+        conflicto = ("DO UPDATE SET contrasena_hash = excluded.contrasena_hash, nombre = excluded.nombre, rol = excluded.rol, avatar = excluded.avatar"
+                     if sobrescribir else "DO NOTHING")
+        q = f"INSERT INTO usuarios (usuario, contrasena_hash, nombre, rol, avatar, fecha_creacion, fecha_ultimo_acceso) VALUES (?,?,?,?,?,?,?) ON CONFLICT (usuario) {conflicto}"
+        pasos = [(q, (u, d.get('contrasena_hash'), d.get('nombre'), d.get('rol'), d.get('avatar'), d.get('fecha_creacion'), d.get('fecha_ultimo_acceso')), None) for u, d in usuarios.items()]
+        return self._ejecutar_transaccion(pasos, cambios=[('usuarios', None)])[0]
+
+    def actualizar_accesos(self, accesos):
+        # Un lote de {usuario: fecha} en una transacción; nunca retrocede una fecha escrita por otro worker
+        q = "UPDATE usuarios SET fecha_ultimo_acceso = ? WHERE usuario = ? AND (fecha_ultimo_acceso IS NULL OR fecha_ultimo_acceso < ?)"
+        return self._ejecutar_transaccion([(q, (fecha, usuario, fecha), None) for usuario, fecha in accesos.items()])[0]
+
     def _historial(self, acc, det):
         self._ejecutar_consulta("INSERT INTO historial (accion, detalle) VALUES (?,?)", (acc, det))
\ No newline at end of file
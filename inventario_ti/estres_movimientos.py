@@ -0,0 +1,145 @@
+import argparse
+import os
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from database import ERROR_BD_OCUPADA, DatabaseManager
+
+PREFIJO_SKU = "ESTRES-"
+
+def _pesos_zipf(n, s):
+    # SKU de rango k sale con probabilidad ~ 1/k^s: pocos SKUs "calientes" concentran el tráfico
+    return [1 / (k ** s) for k in range(1, n + 1)]
+
+def _movimiento_ingenuo(db, sku, cant, tipo):
+    # Lectura y escritura separadas, como antes de las actualizaciones condicionales.
+    # Sirve para comprobar que el arnés detecta actualizaciones perdidas.
+    df = db._leer_datos("SELECT stock FROM productos WHERE sku = ?", (sku,))
+    if df.empty: return False, "No existe producto"
+    nuevo = int(df.iloc[0]['stock']) + (cant if tipo == 'entrada' else -cant)
+    if nuevo < 0: return False, "Stock insuficiente"
+    ok, msg = db._ejecutar_transaccion([("UPDATE productos SET stock = ? WHERE sku = ?", (nuevo, sku), None)])
+    if not ok: return False, msg
+    db._ejecutar_consulta("INSERT INTO movimientos (sku, tipo, cantidad, motivo) VALUES (?,?,?,?)", (sku, tipo, cant, 'estres'))
+    return True, "Stock actualizado"
+
+def _hilo(db, config, semilla, resultado, lock):
+    rng = random.Random(semilla)
+    skus, pesos = config['skus'], _pesos_zipf(len(config['skus']), config['sesgo'])
+    neto, latencias, conteo, otros = Counter(), [], Counter(), Counter()
+    fin = time.monotonic() + config['segundos']
+    while time.monotonic() < fin:
+        sku = rng.choices(skus, pesos)[0]
+        tipo = 'salida' if rng.random() < config['pct_salidas'] else 'entrada'
+        cant = rng.randint(1, config['cantidad_max'])
+        ubicacion = rng.choice(config['ubicaciones']) if config['ubicaciones'] and rng.random() < 0.5 else None
+        inicio = time.perf_counter()
+        if config['estrategia'] == 'ingenua':
+            ok, msg = _movimiento_ingenuo(db, sku, cant, tipo)
+        else:
+            ok, msg = db.actualizar_stock(sku, cant, tipo, 'estres', ubicacion)
+        latencias.append(time.perf_counter() - inicio)
+        if ok:
+            neto[sku] += cant if tipo == 'entrada' else -cant
+            conteo['ok'] += 1
+        elif msg.startswith("Stock insuficiente"):
+            conteo['rechazados'] += 1
+        elif msg == ERROR_BD_OCUPADA:
+            # Solo cuenta como bloqueo el conflicto que agotó los reintentos
+            conteo['errores_bloqueo'] += 1
+        else:
+            conteo['otros_errores'] += 1
+            otros[msg] += 1
+    with lock:
+        resultado['neto'].update(neto)
+        resultado['latencias'].extend(latencias)
+        resultado['conteo'].update(conteo)
+        resultado['otros'].update(otros)
+
+def _proceso(config, indice):
+    # Cada proceso tiene su propio DatabaseManager (y sus conexiones), como un worker real
+    db = DatabaseManager(ruta_sqlite=config['bd'])
+    resultado, lock = {'neto': Counter(), 'latencias': [], 'conteo': Counter(), 'otros': Counter()}, threading.Lock()
+    hilos = [threading.Thread(target=_hilo, args=(db, config, indice * 1000 + i, resultado, lock)) for i in range(config['hilos'])]
+    for h in hilos: h.start()
+    for h in hilos: h.join()
+    return resultado
+
+def _preparar(db, config):
+    # Borra solo los datos del arnés (prefijo ESTRES-) y crea los SKUs con su stock inicial
+    for tabla in ('movimientos', 'stock_ubicacion', 'productos'):
+        db._ejecutar_consulta(f"DELETE FROM {tabla} WHERE sku LIKE ?", (PREFIJO_SKU + '%',))
+    for ubicacion in config['ubicaciones']:
+        db.agregar_ubicacion(ubicacion)
+    for sku in config['skus']:
+        db.agregar_producto(sku, sku, 'Estres', 'Estres', 1.0, 1.0, config['stock_inicial'])
+    return {sku: config['stock_inicial'] for sku in config['skus']}
+
+def _stock_final(db):
+    df = db._leer_datos("SELECT sku, stock FROM vista_productos WHERE sku LIKE ?", (PREFIJO_SKU + '%',))
+    return dict(zip(df['sku'], df['stock'].astype(int)))
+
+def _neto_registrado(db):
+    df = db._leer_datos("SELECT sku, SUM(CASE WHEN tipo = 'entrada' THEN cantidad ELSE -cantidad END) AS neto FROM movimientos WHERE sku LIKE ? AND motivo <> 'Stock inicial' GROUP BY sku", (PREFIJO_SKU + '%',))
+    return Counter(dict(zip(df['sku'], df['neto'].astype(int))))
+
+def main():
+    parser = argparse.ArgumentParser(description="Arnés de contención para movimientos de stock")
+    parser.add_argument("--bd", default="estres_inventario.db", help="Archivo SQLite (se ignora si hay DATABASE_URL)")
+    parser.add_argument("--procesos", type=int, default=2)
+    parser.add_argument("--hilos", type=int, default=8, help="Hilos por proceso")
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--skus", type=int, default=50)
+    parser.add_argument("--sesgo", type=float, default=1.2, help="Exponente Zipf: mayor = más contención en pocos SKUs")
+    parser.add_argument("--stock-inicial", type=int, default=100)
+    parser.add_argument("--cantidad-max", type=int, default=5)
+    parser.add_argument("--pct-salidas", type=float, default=0.5)
+    parser.add_argument("--ubicaciones", type=int, default=0, help="Nº de ubicaciones además de CENTRAL")
+    parser.add_argument("--estrategia", choices=["atomica", "ingenua"], default="atomica")
+    args = parser.parse_args()
+
+    config = {
+        'bd': args.bd, 'hilos': args.hilos, 'segundos': args.segundos, 'sesgo': args.sesgo,
+        'skus': [f"{PREFIJO_SKU}{i:05d}" for i in range(args.skus)],
+        'stock_inicial': args.stock_inicial, 'cantidad_max': args.cantidad_max, 'pct_salidas': args.pct_salidas,
+        'ubicaciones': [f"SEDE{i}" for i in range(1, args.ubicaciones + 1)], 'estrategia': args.estrategia,
+    }
+    db = DatabaseManager(ruta_sqlite=args.bd)
+    inicial = _preparar(db, config)
+    motor = "Postgres" if os.getenv("DATABASE_URL") else f"SQLite ({args.bd})"
+    print(f"{motor} | {args.procesos} procesos x {args.hilos} hilos | {args.skus} SKUs, sesgo {args.sesgo} | {args.segundos}s | estrategia {args.estrategia}")
+
+    inicio = time.monotonic()
+    with ProcessPoolExecutor(max_workers=args.procesos) as ex:
+        parciales = list(ex.map(_proceso, [config] * args.procesos, range(args.procesos)))
+    duracion = time.monotonic() - inicio
+
+    neto, latencias, conteo, otros = Counter(), [], Counter(), Counter()
+    for r in parciales:
+        neto.update(r['neto'])
+        latencias.extend(r['latencias'])
+        conteo.update(r['conteo'])
+        otros.update(r['otros'])
+
+    # Invariante: stock final = inicial + neto de los movimientos confirmados a los clientes
+    final, registrado = _stock_final(db), _neto_registrado(db)
+    perdidos = {s: final.get(s, 0) - (inicial[s] + neto[s]) for s in inicial if final.get(s, 0) != inicial[s] + neto[s]}
+    descuadre_log = {s for s in inicial if final.get(s, 0) != inicial[s] + registrado[s]}
+    negativos = [s for s, v in final.items() if v < 0]
+
+    latencias.sort()
+    p = lambda q: latencias[min(len(latencias) - 1, int(q * len(latencias)))] * 1000 if latencias else 0
+    total = sum(conteo.values())
+    print(f"Operaciones: {total} | confirmadas: {conteo['ok']} | rechazadas por stock: {conteo['rechazados']} | "
+          f"errores de bloqueo: {conteo['errores_bloqueo']} | otros errores: {conteo['otros_errores']}")
+    if otros: print("Otros errores: " + " | ".join(f"{msg}: {n}" for msg, n in otros.most_common(5)))
+    print(f"Throughput: {total / duracion:,.1f} ops/s ({conteo['ok'] / duracion:,.1f} confirmadas/s)")
+    print(f"Latencia ms -> p50: {p(0.50):.1f} | p95: {p(0.95):.1f} | p99: {p(0.99):.1f} | máx: {p(1.0):.1f}")
+    print(f"Actualizaciones perdidas: {len(perdidos)} SKUs, {sum(abs(v) for v in perdidos.values())} unidades | "
+          f"stock vs log de movimientos descuadrado: {len(descuadre_log)} SKUs | stock negativo: {len(negativos)}")
+    print("INVARIANTE OK" if not perdidos and not descuadre_log and not negativos else "INVARIANTE VIOLADO")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+
+# Cada cuántos movimientos (globales) o segundos se toma un checkpoint nuevo
+MOVIMIENTOS_POR_CHECKPOINT = 5000
+SEGUNDOS_POR_CHECKPOINT = 24 * 3600
+# Cada cuántos movimientos locales se revisa si corresponde un checkpoint (evita una consulta por movimiento)
+REVISAR_CADA = 200
+# Las fechas de la BD (CURRENT_TIMESTAMP) están en UTC; las que pide el usuario, en hora local del sitio
+ZONA_HORARIA_LOCAL = os.getenv("INVENTARIO_TZ", "America/Lima")
+
+class HistoricoStock:
+    def __init__(self, sistema_inventario):
+        self.sistema = sistema_inventario
+        self._movimientos_locales = 0
+
+    def stock_a_fecha(self, fecha):
+        """
+        Stock por SKU al cierre de 'fecha' en hora local (ZONA_HORARIA_LOCAL). Parte del
+        checkpoint más cercano (o del stock actual, si está más cerca) y solo reproduce
+        los movimientos intermedios.
+        """
+        db = self.sistema.db
+        corte = pd.Timestamp(fecha)
+        if corte == corte.normalize(): corte += pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+        # Fecha local -> UTC, que es como se guarda movimientos.fecha
+        if corte.tzinfo is None: corte = corte.tz_localize(ZONA_HORARIA_LOCAL)
+        corte = corte.tz_convert("UTC")
+        id_corte = db.ultimo_movimiento_hasta(corte.strftime("%Y-%m-%d %H:%M:%S"))
+
+        # Candidatos: checkpoints guardados + la foto en vivo. Gana el de menor delta a reproducir.
+        cercano = min(db.obtener_checkpoints(), key=lambda c: abs(int(c['ultimo_movimiento']) - id_corte), default=None)
+        if cercano is None or db.ultimo_movimiento() - id_corte < abs(int(cercano['ultimo_movimiento']) - id_corte):
+            # Base y movimientos a deshacer salen de la misma foto (ver obtener_stock_actual)
+            df_base, id_base, movs = db.obtener_stock_actual(desde_id=id_corte)
+            origen = "stock actual"
+        else:
+            # El checkpoint se tomó con movimientos bloqueado: su base es consistente con los ids
+            df_base, id_base = db.obtener_stock_checkpoint(cercano['id']), int(cercano['ultimo_movimiento'])
+            desde, hasta = sorted((id_base, id_corte))
+            movs = db.obtener_movimientos_entre(desde, hasta)
+            origen = f"checkpoint #{cercano['id']}"
+
+        # Delta vectorizado: entradas suman, salidas restan, agrupado por SKU
+        stock = df_base.set_index('sku')['stock'].astype('int64') if not df_base.empty else pd.Series(dtype='int64')
+        if not movs.empty:
+            signo = np.where(movs['tipo'].to_numpy() == 'entrada', 1, -1)
+            delta = pd.Series(signo * movs['cantidad'].to_numpy(dtype='int64'), index=movs['sku']).groupby(level=0).sum()
+            # Checkpoint anterior al corte: se avanza; posterior: se retrocede
+            stock = stock.add(delta, fill_value=0) if id_base <= id_corte else stock.sub(delta, fill_value=0)
+
+        df = stock[stock != 0].astype('int64').rename('stock').rename_axis('sku').reset_index()
+        productos = self.sistema.df
+        if not productos.empty:
+            df = df.merge(productos[['sku', 'nombre', 'categoria', 'precio_compra']], on='sku', how='left')
+            df['valor'] = df['precio_compra'].fillna(0) * df['stock']
+        df.attrs['origen'] = origen
+        df.attrs['movimientos_reproducidos'] = len(movs)
+        return df.sort_values('sku').reset_index(drop=True)
+
+    def registrar_movimiento(self):
+        # Llamado tras cada movimiento local; solo consulta la BD cada REVISAR_CADA movimientos
+        self._movimientos_locales += 1
+        if self._movimientos_locales >= REVISAR_CADA:
+            self._movimientos_locales = 0
+            self.checkpoint_si_corresponde()
+
+    def checkpoint_si_corresponde(self):
+        db = self.sistema.db
+        ultimo = db.ultimo_movimiento()
+        checkpoints = db.obtener_checkpoints()
+        if not checkpoints: return ultimo > 0 and db.crear_checkpoint_stock()[0]
+        
+        previo = checkpoints[-1]
+        antiguedad = time.time() - pd.Timestamp(previo['fecha']).timestamp()
+        if ultimo - int(previo['ultimo_movimiento']) >= MOVIMIENTOS_POR_CHECKPOINT or antiguedad >= SEGUNDOS_POR_CHECKPOINT:
+            return db.crear_checkpoint_stock()[0]
+        return False
@@ -0,0 +1,78 @@
+# Prueba de concurrencia del perfil SQLite "concurrente" (WAL).
+# Ejecutar:  python -m pytest test_concurrencia_sqlite.py   o   python test_concurrencia_sqlite.py
+import os
+import tempfile
+import threading
+import time
+from database import DatabaseManager
+
+def _db_temporal(directorio):
+    # Siempre contra un SQLite temporal: quien llama se encarga de quitar DATABASE_URL
+    db = DatabaseManager(ruta_sqlite=os.path.join(directorio, "prueba.db"), perfil_sqlite="concurrente")
+    db.agregar_producto("P1", "Producto", "RAM", "Marca", 10.0, 20.0, 1000)
+    return db
+
+def _lectura_no_espera_al_escritor():
+    with tempfile.TemporaryDirectory() as directorio:
+        db = _db_temporal(directorio)
+        escritor = db._conectar_sqlite()
+        try:
+            # Otra conexión toma el lock de escritura y deja un cambio sin confirmar. EXCLUSIVE es
+            # el lock que toma un commit: con el journal clásico bloquea a los lectores, con WAL no.
+            escritor.execute("BEGIN EXCLUSIVE")
+            escritor.execute("UPDATE productos SET stock = 0 WHERE sku = 'P1'")
+
+            inicio = time.perf_counter()
+            producto = db.obtener_producto("P1")
+            duracion = time.perf_counter() - inicio
+
+            # Con el journal clásico la lectura esperaría el busy_timeout (5 s) y fallaría
+            assert duracion < 0.5, f"La lectura tardó {duracion:.3f}s con el escritor activo"
+            assert producto["stock"] == 1000  # ve la última versión confirmada
+        finally:
+            escritor.rollback()
+            escritor.close()
+
+def _escritores_concurrentes_confirman_todo():
+    with tempfile.TemporaryDirectory() as directorio:
+        db = _db_temporal(directorio)
+        hilos, movimientos = 8, 25
+        resultados, lecturas, fin = [], [], threading.Event()
+
+        def escribir():
+            for _ in range(movimientos):
+                resultados.append(db.actualizar_stock("P1", 1, "salida")[0])
+
+        def leer():
+            while not fin.is_set():
+                inicio = time.perf_counter()
+                db.obtener_kpis()
+                lecturas.append(time.perf_counter() - inicio)
+
+        lector = threading.Thread(target=leer)
+        lector.start()
+        escritores = [threading.Thread(target=escribir) for _ in range(hilos)]
+        for h in escritores: h.start()
+        for h in escritores: h.join()
+        fin.set()
+        lector.join()
+
+        assert all(resultados) and len(resultados) == hilos * movimientos
+        assert db.obtener_producto("P1")["stock"] == 1000 - hilos * movimientos
+        assert lecturas and max(lecturas) < 1.0, f"Lectura más lenta: {max(lecturas):.3f}s"
+
+# Con pytest, monkeypatch restaura DATABASE_URL al terminar cada prueba
+def test_lectura_no_espera_al_escritor(monkeypatch):
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+    _lectura_no_espera_al_escritor()
+
+def test_escritores_concurrentes_confirman_todo(monkeypatch):
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+    _escritores_concurrentes_confirman_todo()
+
+if __name__ == "__main__":
+    # Ejecución directa: el proceso es solo de estas pruebas
+    os.environ.pop("DATABASE_URL", None)
+    _lectura_no_espera_al_escritor()
+    _escritores_concurrentes_confirman_todo()
+    print("OK")